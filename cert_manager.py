@@ -10,17 +10,22 @@ import os
 import sys
 import json
 import argparse
-import subprocess
-import tempfile
-import re
+import contextlib
 import logging
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
+# 现有证书剩余有效期超过该天数时跳过重新签发 (可在配置中用 renew_before_days 覆盖)
+# 必须不小于 cron 的执行间隔: 默认 cron 每 3 个月执行一次 (最长 92 天)，
+# 否则一次跳过后，证书可能在下一次执行前过期
+RENEW_BEFORE_DAYS = 92
+
 try:
     import yaml
 except ImportError:
@@ -28,12 +33,19 @@ except ImportError:
     print("运行: pip install pyyaml")
     sys.exit(1)
 
+from cloudflare_api import CloudflareAPI, MAX_CONNECTIONS, pem_fingerprint
+from cryptography import x509
+
+# 并发处理域名的最大线程数，与 CloudflareAPI 共享连接池的大小相同，每个线程都能分到一个连接
+MAX_WORKERS = MAX_CONNECTIONS
+
 # 导入邮件通知模块
 try:
-    from email_notifier import EmailNotifier, create_email_notifier_from_config
+    from email_notifier import EmailNotifier, NotificationQueue, create_email_notifier_from_config
 except ImportError:
     logger.warning("email_notifier.py 未找到，邮件通知功能不可用")
     EmailNotifier = None
+    NotificationQueue = None
     create_email_notifier_from_config = None
 
 
@@ -42,41 +54,50 @@ class ConfigLoader:
 
     DEFAULT_CONFIG_PATH = "config.yaml"
 
+    # 域名配置中为 null 时回退到全局默认值的字段
+    INHERITED_KEYS = ['origin_ca_key', 'cert_type', 'validity_days', 'enable_cron',
+                      'notification_email', 'base_cert_dir', 'renew_before_days']
+
     def __init__(self, config_path=None):
         self.config_path = config_path or self.DEFAULT_CONFIG_PATH
         self.config = None
+        self._merged = {}
 
     def load(self):
-        """加载配置文件"""
+        """加载配置文件，并预先合并各域名配置"""
         if not os.path.exists(self.config_path):
             return None
 
+        # 优先使用 libyaml 提供的 C 解析器
         with open(self.config_path, 'r', encoding='utf-8') as f:
-            self.config = yaml.safe_load(f)
-
-        return self.config
+            self.config = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
 
-    def get_domain_config(self, domain):
-        """获取指定域名的完整配置，合并默认值"""
-        if not self.config or 'domains' not in self.config:
-            return None
+        domains = (self.config or {}).get('domains') or {}
+        self._merged = {
+            domain: self._merge(domain_config)
+            for domain, domain_config in domains.items()
+            if domain_config
+        }
 
-        domain_config = self.config['domains'].get(domain)
-        if not domain_config:
-            return None
+        return self.config
 
-        # 合并默认配置
+    def _merge(self, domain_config):
+        """合并默认配置与域名配置"""
         default_config = self.config.get('default', {})
         merged_config = default_config.copy()
         merged_config.update(domain_config)
 
         # 处理 null 值，使用默认值
-        for key in ['origin_ca_key', 'cert_type', 'validity_days', 'enable_cron', 'notification_email', 'base_cert_dir']:
+        for key in self.INHERITED_KEYS:
             if merged_config.get(key) is None:
                 merged_config[key] = default_config.get(key)
 
         return merged_config
 
+    def get_domain_config(self, domain):
+        """获取指定域名的完整配置，合并默认值"""
+        return self._merged.get(domain)
+
     def list_domains(self):
         """列出所有已配置的域名"""
         if not self.config or 'domains' not in self.config:
@@ -85,196 +106,269 @@ class ConfigLoader:
         return list(self.config['domains'].keys())
 
 
-class CloudflareAPI:
-    """Cloudflare API 交互类"""
-
-    def __init__(self, origin_ca_key, domain, zone_id=None):
-        self.origin_ca_key = origin_ca_key
-        self.domain = domain
-        self.zone_id = zone_id
-        self.base_url = "https://api.cloudflare.com/client/v4"
-
-        # 设置 Origin CA Key 的请求头
-        self.headers = {
-            "Content-Type": "application/json",
-            "X-Auth-User-Service-Key": self.origin_ca_key
-        }
-
-    def generate_csr(self, hostnames):
-        """生成 CSR (证书签名请求)"""
-        print("生成 CSR...")
-
-        # 创建临时目录
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # 生成私钥
-            key_path = os.path.join(temp_dir, "private.key")
-            subprocess.run(
-                ["openssl", "genrsa", "-out", key_path, "2048"],
-                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
+class CertCache:
+    """已签发证书记录 (签发参数 -> 证书指纹)，保存在证书基础目录下，用于跳过不必要的重新签发"""
 
-            # 创建 CSR 配置文件
-            config_path = os.path.join(temp_dir, "csr.conf")
-            with open(config_path, "w") as f:
-                f.write("[req]\n")
-                f.write("distinguished_name = req_distinguished_name\n")
-                f.write("req_extensions = v3_req\n")
-                f.write("prompt = no\n")
-                f.write("[req_distinguished_name]\n")
-                f.write(f"CN = {hostnames[0]}\n")
-                f.write("[v3_req]\n")
-                f.write("keyUsage = keyEncipherment, dataEncipherment\n")
-                f.write("extendedKeyUsage = serverAuth\n")
-                f.write("subjectAltName = @alt_names\n")
-                f.write("[alt_names]\n")
-                for i, hostname in enumerate(hostnames):
-                    f.write(f"DNS.{i+1} = {hostname}\n")
-
-            # 生成 CSR
-            csr_path = os.path.join(temp_dir, "request.csr")
-            subprocess.run(
-                ["openssl", "req", "-new", "-key", key_path, "-out", csr_path, "-config", config_path],
-                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
+    FILE_NAME = ".cert_cache.json"
 
-            # 读取 CSR 和私钥
-            with open(csr_path, "r") as f:
-                csr = f.read()
+    # 多个域名可能共享同一个基础目录，读写记录文件需要加锁
+    _lock = threading.Lock()
 
-            with open(key_path, "r") as f:
-                private_key = f.read()
+    def __init__(self, cert_dir_base, cf):
+        """
+        Args:
+            cert_dir_base: 证书基础目录
+            cf: CloudflareAPI 实例，记录文件与证书文件一样通过其 write_files 原子替换
+        """
+        self.cert_dir_base = cert_dir_base
+        self.path = os.path.join(cert_dir_base, self.FILE_NAME)
+        self.cf = cf
 
-            return csr, private_key
+    @staticmethod
+    def make_key(domain, hostnames, validity_days, cert_type):
+        """生成签发参数对应的记录键"""
+        return f"{domain}|{','.join(sorted(hostnames))}|{validity_days}|{cert_type}"
 
-    def create_origin_certificate(self, hostnames, validity_days=90, request_type="origin-rsa"):
-        """创建新的 Origin CA 证书"""
+    def _load(self):
+        """读取记录文件，文件不存在或内容损坏返回空字典，存在但无法读取时返回 None"""
         try:
-            import requests
-        except ImportError:
-            print("错误: 需要安装 requests 库")
-            print("运行: pip install requests")
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"证书记录已损坏，将重新生成 {self.path}: {e}")
+            return {}
+        except OSError as e:
+            logger.warning(f"无法读取证书记录 {self.path}: {e}")
             return None
 
-        url = f"{self.base_url}/certificates"
+    def get(self, key):
+        """获取记录的证书指纹，不存在返回 None"""
+        with self._lock:
+            return (self._load() or {}).get(key)
+
+    def set(self, key, fingerprint):
+        """
+        记录签发参数对应的证书指纹，写入失败时仅给出警告
+
+        基础目录需要 sudo 才能写入时不保存记录: sudo 写入的文件普通用户无法读回，
+        保存了也无法用于跳过签发，反而每次多一次 sudo 调用
+        """
+        if not os.access(self.cert_dir_base, os.W_OK):
+            logger.warning(f"无权限写入 {self.cert_dir_base}，不保存证书记录 (以该用户运行时不会跳过签发)")
+            return
+
+        with self._lock:
+            data = self._load()
+            if data is None:
+                # 无法读取已有记录时不覆盖，避免丢失其他域名的记录
+                logger.warning(f"证书记录未更新: {self.path}")
+                return
+            data[key] = fingerprint
+            try:
+                saved = self.cf.write_files(self.cert_dir_base, {self.path: json.dumps(data, indent=2)})
+            except OSError as e:
+                print(f"无法写入证书记录 {self.path}: {e}")
+                saved = False
+            if not saved:
+                logger.warning(f"证书记录未保存，下次运行将重新签发: {self.path}")
+
+    def remaining_days(self, key, domain, hostnames):
+        """
+        返回现有证书的剩余有效天数
+
+        仅当每个主机名的 crt/key/fingerprint 文件都存在、证书与记录的签发参数一致时返回天数，
+        否则返回 None
+        """
+        recorded = self.get(key)
+        if recorded is None:
+            return None
 
-        # 生成 CSR 和私钥
-        csr, private_key = self.generate_csr(hostnames)
+        cert_content = None
+        for hostname in hostnames:
+            prefix = os.path.join(self.cert_dir_base, domain, hostname, f"{domain}.{hostname}")
+            if not all(os.path.isfile(f"{prefix}.{ext}") for ext in ("key", "fingerprint")):
+                return None
+            try:
+                with open(f"{prefix}.crt", 'r') as f:
+                    content = f.read()
+                if pem_fingerprint(content) != recorded:
+                    return None
+            except FileNotFoundError:
+                return None
+            except (OSError, ValueError) as e:
+                logger.warning(f"无法读取现有证书 {prefix}.crt: {e}")
+                return None
+            cert_content = cert_content or content
+
+        cert = x509.load_pem_x509_certificate(cert_content.encode())
+        return (cert.not_valid_after_utc - datetime.now(timezone.utc)).days
+
+
+class _ThreadBufferedStdout:
+    """
+    按线程缓冲 stdout，使并发处理时每个域名的输出成块打印，不相互穿插
+
+    作为上下文管理器使用: 进入时替换 sys.stdout，退出时恢复为原来的输出流
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        sys.stdout = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.restore()
+        return False
+
+    def restore(self):
+        """将 sys.stdout 恢复为原来的输出流"""
+        if sys.stdout is self:
+            sys.stdout = self._stream
+
+    def begin(self):
+        """开始缓冲当前线程的输出"""
+        self._local.buffer = []
+
+    def end(self):
+        """结束缓冲，并将当前线程的输出一次性写出"""
+        self.flush()
+        self._local.buffer = None
+
+    def write(self, text):
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            return self._stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        """
+        写出当前线程已缓冲的输出
+
+        缓冲期间的输出仍保持成块，只有显式 flush 时 (如调用 sudo 前输出提示) 才会提前写出
+        """
+        buffer = getattr(self._local, 'buffer', None)
+        with self._lock:
+            if buffer:
+                self._stream.write("".join(buffer))
+                buffer.clear()
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def process_domain(domain, args, config_loader, email_notifier=None):
+    """处理单个域名：创建证书、保存并发送通知，成功返回 True"""
+    domain_config = config_loader.get_domain_config(domain)
+    if not domain_config:
+        print(f"警告: 域名 {domain} 配置不存在")
+        return False
+
+    # 获取配置
+    origin_ca_key = domain_config.get('origin_ca_key')
+    # 去除重复的主机名 (保持原有顺序)，避免为同一目录重复保存或链接
+    hostnames = list(dict.fromkeys(args.hostnames or domain_config.get('hostnames', [])))
+    cert_type = args.type or domain_config.get('cert_type', 'origin-rsa')
+    validity_days = args.validity or domain_config.get('validity_days', 90)
+    cert_dir_base = args.cert_dir or domain_config.get('base_cert_dir', '/etc/cert')
+    zone_id = args.zone_id or domain_config.get('zone_id')
+    notification_email = domain_config.get('notification_email', '')
+    renew_before_days = domain_config.get('renew_before_days')
+    if renew_before_days is None:
+        renew_before_days = RENEW_BEFORE_DAYS
+
+    # 获取收件人邮箱列表
+    recipients = []
+    if notification_email:
+        recipients = [e.strip() for e in notification_email.split(',') if e.strip()]
+
+    if not origin_ca_key:
+        print(f"错误: 域名 {domain} 未配置 origin_ca_key")
+        return False
+
+    if not hostnames:
+        print(f"错误: 域名 {domain} 未配置 hostnames")
+        return False
 
-        # 构建请求数据
-        data = {
-            "hostnames": hostnames,
-            "requested_validity": validity_days,
-            "request_type": request_type,
-            "csr": csr
-        }
+    print(f"\n{'='*50}")
+    print(f"处理域名: {domain}")
+    print(f"主机名: {', '.join(hostnames)}")
+    print(f"证书类型: {cert_type}")
+    print(f"有效期: {validity_days} 天")
+    print(f"{'='*50}")
 
-        response = requests.post(url, headers=self.headers, json=data)
-        if response.status_code != 200:
-            print(f"创建证书失败: {response.text}")
-            return None
+    cf = CloudflareAPI(origin_ca_key, domain, zone_id)
 
-        data = response.json()
-        if not data["success"]:
-            print(f"创建证书失败: {data['errors']}")
-            return None
+    # 现有证书与签发参数一致、所有主机名的文件齐全且尚未临近过期时，无需重新签发
+    cert_cache = CertCache(cert_dir_base, cf)
+    cache_key = CertCache.make_key(domain, hostnames, validity_days, cert_type)
+    if not args.force:
+        remaining = cert_cache.remaining_days(cache_key, domain, hostnames)
+        if remaining is not None and remaining > renew_before_days:
+            print(f"现有证书剩余有效期 {remaining} 天 (> {renew_before_days} 天)，跳过签发: {os.path.join(cert_dir_base, domain)}")
+            print("如需强制重新签发，请使用 --force")
+            return True
 
-        # 将私钥添加到结果中
-        result = data["result"]
-        result["private_key"] = private_key
+    print(f"为主机名 {', '.join(hostnames)} 创建新的 {cert_type} 证书...")
+    cert = cf.create_origin_certificate(hostnames, validity_days, cert_type)
 
-        return result
+    if not cert:
+        return False
 
-    def get_certificate_fingerprint(self, cert_content):
-        """获取证书的指纹"""
-        with tempfile.NamedTemporaryFile(mode='w+', suffix='.crt', delete=False) as temp_file:
-            temp_file.write(cert_content)
-            temp_file_path = temp_file.name
+    print("证书创建成功")
+    print(f"证书ID: {cert.get('id', 'N/A')}")
+    print(f"过期时间: {cert.get('expires_at', 'N/A')}")
 
-        try:
-            result = subprocess.run(
-                ["openssl", "x509", "-in", temp_file_path, "-fingerprint", "-sha256", "-noout"],
-                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-            )
-            # 提取指纹并去除可能的额外字符
-            fingerprint_line = result.stdout.strip()
-            if "=" in fingerprint_line:
-                fingerprint = fingerprint_line.split("=")[-1].strip()
-            else:
-                fingerprint = fingerprint_line.strip()
-
-            # 使用正则表达式确保只保留有效的指纹字符
-            fingerprint = re.sub(r'[^A-F0-9:]', '', fingerprint.upper())
-            return fingerprint
-        except subprocess.CalledProcessError as e:
-            print(f"获取证书指纹失败: {e}")
-            return None
-        finally:
-            os.unlink(temp_file_path)
+    # 获取证书指纹
+    fingerprint = cf.get_certificate_fingerprint(cert.get("certificate", ""))
+    if fingerprint:
+        print(f"证书指纹: {fingerprint}")
 
-    def save_to_cert_dir(self, domain, hostname, cert_content, key_content, fingerprint, cert_dir_base="/etc/cert"):
-        """将证书和密钥保存到指定目录 (基础目录/域名/主机名/)"""
-        # 构建目录路径: cert_dir_base/domain/hostname/
-        host_specific_dir = os.path.join(cert_dir_base, domain, hostname)
+    # 保存证书
+    if "private_key" in cert and fingerprint:
+        all_saved = True
+        saved_hostname = None
 
-        # 如果目录不存在，则创建
-        if not os.path.exists(host_specific_dir):
-            try:
-                os.makedirs(host_specific_dir, exist_ok=True)
-                print(f"创建目录: {host_specific_dir}")
-            except PermissionError:
-                print(f"无权限创建目录: {host_specific_dir}")
-                print("尝试使用 sudo 创建目录...")
-                try:
-                    subprocess.run(["sudo", "mkdir", "-p", host_specific_dir], check=True)
-                    print(f"成功创建目录: {host_specific_dir}")
-                except subprocess.CalledProcessError:
-                    print(f"无法创建目录: {host_specific_dir}")
-                    return False
-
-        # 文件名: domain.hostname.crt
-        file_prefix = f"{domain}.{hostname}"
-
-        # 保存证书
-        cert_path = os.path.join(host_specific_dir, f"{file_prefix}.crt")
-        if not self._write_file(cert_path, cert_content):
-            return False
-
-        # 保存密钥
-        key_path = os.path.join(host_specific_dir, f"{file_prefix}.key")
-        if not self._write_file(key_path, key_content):
-            return False
-
-        # 保存指纹
-        fingerprint_path = os.path.join(host_specific_dir, f"{file_prefix}.fingerprint")
-        if not self._write_file(fingerprint_path, fingerprint):
-            return False
-
-        print(f"证书已保存到: {cert_path}")
-        print(f"密钥已保存到: {key_path}")
-        print(f"指纹已保存到: {fingerprint_path}")
-
-        return True
-
-    def _write_file(self, file_path, content):
-        """写文件，支持 sudo 回退"""
-        try:
-            with open(file_path, "w") as f:
-                f.write(content)
-            return True
-        except PermissionError:
-            print(f"无权限写入文件: {file_path}")
-            print("尝试使用 sudo 写入文件...")
-            try:
-                with tempfile.NamedTemporaryFile(mode='w+', delete=False) as temp_file:
-                    temp_file.write(content)
-                    temp_file_path = temp_file.name
-                subprocess.run(["sudo", "cp", temp_file_path, file_path], check=True)
-                os.unlink(temp_file_path)
-                print(f"成功写入文件: {file_path}")
-                return True
-            except (subprocess.CalledProcessError, OSError):
-                print(f"无法写入文件: {file_path}")
-                return False
+        # 为每个主机名保存证书: 第一个主机名写入文件，其余主机名优先使用硬链接
+        for hostname in hostnames:
+            saved = saved_hostname is not None and cf.link_to_cert_dir(
+                domain, saved_hostname, hostname, cert_dir_base
+            )
+            if not saved:
+                saved = cf.save_to_cert_dir(
+                    domain,
+                    hostname,
+                    cert.get("certificate", ""),
+                    cert.get("private_key", ""),
+                    fingerprint,
+                    cert_dir_base
+                )
+            if saved and saved_hostname is None:
+                saved_hostname = hostname
+            all_saved = all_saved and saved
+
+            # 发送邮件通知
+            if saved and email_notifier and recipients:
+                cert_info = {
+                    'hostname': hostname,
+                    'cert_path': os.path.join(cert_dir_base, domain, hostname, f"{domain}.{hostname}.crt"),
+                    'key_path': os.path.join(cert_dir_base, domain, hostname, f"{domain}.{hostname}.key"),
+                    'fingerprint': fingerprint,
+                    'expires_at': cert.get('expires_at', 'N/A')
+                }
+                email_notifier.send_cert_renewal_notification(domain, cert_info, recipients)
+
+        if all_saved:
+            cert_cache.set(cache_key, fingerprint)
+
+    return True
 
 
 def main():
@@ -287,6 +381,7 @@ def main():
     parser.add_argument("--cert_dir", help="证书保存基础目录")
     parser.add_argument("--zone_id", help="Cloudflare Zone ID")
     parser.add_argument("--no-email", action="store_true", help="禁用邮件通知")
+    parser.add_argument("--force", action="store_true", help="强制重新签发证书，忽略现有证书的剩余有效期")
 
     args = parser.parse_args()
 
@@ -322,89 +417,25 @@ def main():
     else:
         print("邮件通知已禁用")
 
-    success_count = 0
-    fail_count = 0
-
-    for domain in domains:
-        domain_config = config_loader.get_domain_config(domain)
-        if not domain_config:
-            print(f"警告: 域名 {domain} 配置不存在")
-            fail_count += 1
-            continue
-
-        # 获取配置
-        origin_ca_key = domain_config.get('origin_ca_key')
-        hostnames = args.hostnames or domain_config.get('hostnames', [])
-        cert_type = args.type or domain_config.get('cert_type', 'origin-rsa')
-        validity_days = args.validity or domain_config.get('validity_days', 90)
-        cert_dir_base = args.cert_dir or domain_config.get('base_cert_dir', '/etc/cert')
-        zone_id = args.zone_id or domain_config.get('zone_id')
-        notification_email = domain_config.get('notification_email', '')
-
-        # 获取收件人邮箱列表
-        recipients = []
-        if notification_email:
-            recipients = [e.strip() for e in notification_email.split(',') if e.strip()]
-
-        if not origin_ca_key:
-            print(f"错误: 域名 {domain} 未配置 origin_ca_key")
-            fail_count += 1
-            continue
-
-        if not hostnames:
-            print(f"错误: 域名 {domain} 未配置 hostnames")
-            fail_count += 1
-            continue
-
-        print(f"\n{'='*50}")
-        print(f"处理域名: {domain}")
-        print(f"主机名: {', '.join(hostnames)}")
-        print(f"证书类型: {cert_type}")
-        print(f"有效期: {validity_days} 天")
-        print(f"{'='*50}")
-
-        cf = CloudflareAPI(origin_ca_key, domain, zone_id)
-
-        print(f"为主机名 {', '.join(hostnames)} 创建新的 {cert_type} 证书...")
-        cert = cf.create_origin_certificate(hostnames, validity_days, cert_type)
-
-        if cert:
-            print("证书创建成功")
-            print(f"证书ID: {cert.get('id', 'N/A')}")
-            print(f"过期时间: {cert.get('expires_at', 'N/A')}")
-
-            # 获取证书指纹
-            fingerprint = cf.get_certificate_fingerprint(cert.get("certificate", ""))
-            if fingerprint:
-                print(f"证书指纹: {fingerprint}")
-
-            # 保存证书
-            if "private_key" in cert and fingerprint:
-                # 为每个主机名保存证书
-                for hostname in hostnames:
-                    saved = cf.save_to_cert_dir(
-                        domain,
-                        hostname,
-                        cert.get("certificate", ""),
-                        cert.get("private_key", ""),
-                        fingerprint,
-                        cert_dir_base
-                    )
-
-                    # 发送邮件通知
-                    if saved and email_notifier and recipients:
-                        cert_info = {
-                            'hostname': hostname,
-                            'cert_path': os.path.join(cert_dir_base, domain, hostname, f"{domain}.{hostname}.crt"),
-                            'key_path': os.path.join(cert_dir_base, domain, hostname, f"{domain}.{hostname}.key"),
-                            'fingerprint': fingerprint,
-                            'expires_at': cert.get('expires_at', 'N/A')
-                        }
-                        email_notifier.send_cert_renewal_notification(domain, cert_info, recipients)
-
-            success_count += 1
-        else:
-            fail_count += 1
+    # 各域名相互独立，并发处理以重叠网络等待
+    stdout = _ThreadBufferedStdout(sys.stdout)
+
+    # 通知邮件由后台线程异步发送，并复用同一个 SMTP 连接
+    notifications = NotificationQueue(email_notifier) if email_notifier else None
+
+    def run(domain):
+        stdout.begin()
+        try:
+            return process_domain(domain, args, config_loader, notifications)
+        finally:
+            stdout.end()
+
+    with stdout, notifications or contextlib.nullcontext():
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(domains))) as executor:
+            results = list(executor.map(run, domains))
+
+    success_count = sum(results)
+    fail_count = len(results) - success_count
 
     print(f"\n{'='*50}")
     print(f"完成: 成功 {success_count}, 失败 {fail_count}")
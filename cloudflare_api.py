@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cloudflare Origin CA API 封装
+供 cert_manager.py 与 cloudflare_cert_token.py 共用
+"""
+
+import os
+import sys
+import subprocess
+import tempfile
+import functools
+import threading
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    print("错误: 需要安装 requests 库")
+    print("运行: pip install requests")
+    sys.exit(1)
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+    from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+except ImportError:
+    print("错误: 需要安装 cryptography 库")
+    print("运行: pip install cryptography")
+    sys.exit(1)
+
+# 共享连接池大小，cert_manager 的并发线程数 (MAX_WORKERS) 直接取该值
+MAX_CONNECTIONS = 16
+
+# 并发处理多个域名时逐个执行 sudo，避免多个密码提示同时争用终端
+_sudo_lock = threading.Lock()
+
+# sudo 写入脚本: $0 为目标目录，其余参数为成组的 (临时文件, 权限, 属主 uid:gid)；
+# 每个文件先复制为 .tmp 再 mv 替换，保证替换是原子的。替换已有文件时设置为原文件的
+# 权限和属主 (由调用方以数字形式给出，不依赖 GNU 的 --reference)，新文件的权限和属主为 "-"
+SUDO_INSTALL_SCRIPT = (
+    'mkdir -p "$0" || exit 1; '
+    'while [ $# -gt 2 ]; do '
+    'dst="$0/${1##*/}"; '
+    'cp -- "$1" "$dst.tmp" || exit 1; '
+    'if [ "$2" != - ]; then chown "$3" "$dst.tmp" && chmod "$2" "$dst.tmp" || exit 1; fi; '
+    'mv -f -- "$dst.tmp" "$dst" || exit 1; '
+    'shift 3; '
+    'done'
+)
+
+# sudo 硬链接脚本: $0 为目标目录，其余参数为成对的 (源文件, 目标文件)；
+# 先链接为 .link 再 mv 替换，与非 sudo 路径一致
+SUDO_LINK_SCRIPT = (
+    'mkdir -p "$0" || exit 1; '
+    'while [ $# -gt 1 ]; do '
+    'ln -f -- "$1" "$2.link" && mv -f -- "$2.link" "$2" || exit 1; '
+    'shift 2; '
+    'done'
+)
+
+# CSR 中固定不变的扩展
+# RSA: keyUsage = keyEncipherment, dataEncipherment
+CSR_KEY_USAGE = x509.KeyUsage(
+    digital_signature=False, content_commitment=False,
+    key_encipherment=True, data_encipherment=True,
+    key_agreement=False, key_cert_sign=False, crl_sign=False,
+    encipher_only=False, decipher_only=False
+)
+# ECDSA: keyUsage = digitalSignature
+CSR_KEY_USAGE_ECC = x509.KeyUsage(
+    digital_signature=True, content_commitment=False,
+    key_encipherment=False, data_encipherment=False,
+    key_agreement=False, key_cert_sign=False, crl_sign=False,
+    encipher_only=False, decipher_only=False
+)
+# extendedKeyUsage = serverAuth
+CSR_EXTENDED_KEY_USAGE = x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH])
+
+
+@functools.lru_cache(maxsize=64)
+def pem_fingerprint(cert_content):
+    """计算 PEM 证书的 SHA-256 指纹 (格式 AA:BB:...)，结果按证书内容缓存"""
+    cert = x509.load_pem_x509_certificate(cert_content.encode())
+    return cert.fingerprint(hashes.SHA256()).hex(":").upper()
+
+
+def _is_same_file(path1, path2):
+    """两个路径是否指向同一文件 (任一不存在时返回 False)"""
+    try:
+        return os.path.samefile(path1, path2)
+    except OSError:
+        return False
+
+
+def _run_sudo_script(script, *args):
+    """
+    以 sudo 执行 sh 脚本，失败时抛出 subprocess.CalledProcessError
+
+    执行前先写出当前线程已缓冲的输出，使 sudo 密码提示前能看到对应的提示信息
+    """
+    with _sudo_lock:
+        sys.stdout.flush()
+        subprocess.run(["sudo", "sh", "-c", script, *args], check=True)
+
+
+class CloudflareAPI:
+    """Cloudflare API 交互类"""
+
+    # 所有实例共享的 HTTP 会话，复用到 api.cloudflare.com 的 TLS 连接
+    _session = None
+    _session_lock = threading.Lock()
+
+    def __init__(self, origin_ca_key, domain, zone_id=None):
+        self.origin_ca_key = origin_ca_key
+        self.domain = domain
+        self.zone_id = zone_id
+        self.base_url = "https://api.cloudflare.com/client/v4"
+
+        # 设置 Origin CA Key 的请求头
+        self.headers = {
+            "Content-Type": "application/json",
+            "X-Auth-User-Service-Key": self.origin_ca_key
+        }
+
+    @classmethod
+    def _get_session(cls):
+        """获取共享的 requests.Session (线程安全，首次调用时创建)"""
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=MAX_CONNECTIONS,
+                    pool_maxsize=MAX_CONNECTIONS,
+                    max_retries=Retry(total=3, backoff_factor=0.3)
+                )
+                session.mount("https://", adapter)
+                cls._session = session
+            return cls._session
+
+    def get_zone_id(self):
+        """获取域名的 Zone ID"""
+        if self.zone_id:
+            print(f"使用 zoneID: {self.zone_id}")
+            return self.zone_id
+        else:
+            print("未提供 zoneID，请检查参数或环境变量 CF_ZONE_ID")
+            return None
+
+    def generate_csr(self, hostnames, request_type="origin-rsa"):
+        """生成 CSR (证书签名请求)，origin-ecc 使用 P-256 密钥，否则使用 RSA-2048"""
+        print("生成 CSR...")
+
+        # 生成与证书类型匹配的私钥
+        if request_type == "origin-ecc":
+            key = ec.generate_private_key(ec.SECP256R1())
+            key_usage = CSR_KEY_USAGE_ECC
+        else:
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            key_usage = CSR_KEY_USAGE
+
+        # 构建 CSR: CN 为第一个主机名，所有主机名写入 SAN
+        csr = (
+            x509.CertificateSigningRequestBuilder()
+            .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostnames[0])]))
+            .add_extension(key_usage, critical=False)
+            .add_extension(CSR_EXTENDED_KEY_USAGE, critical=False)
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(h) for h in hostnames]), critical=False)
+            .sign(key, hashes.SHA256())
+        )
+
+        csr_pem = csr.public_bytes(serialization.Encoding.PEM).decode()
+        private_key = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ).decode()
+
+        return csr_pem, private_key
+
+    def create_origin_certificate(self, hostnames, validity_days=90, request_type="origin-rsa"):
+        """创建新的 Origin CA 证书"""
+        url = f"{self.base_url}/certificates"
+
+        # 生成 CSR 和私钥
+        csr, private_key = self.generate_csr(hostnames, request_type)
+
+        # 构建请求数据
+        data = {
+            "hostnames": hostnames,
+            "requested_validity": validity_days,
+            "request_type": request_type,
+            "csr": csr
+        }
+
+        # 各域名的 Origin CA Key 不同，请求头按请求传入
+        session = self._get_session()
+        response = session.post(url, headers=self.headers, json=data)
+        if response.status_code != 200:
+            print(f"创建证书失败: {response.text}")
+            return None
+
+        data = response.json()
+        if not data["success"]:
+            print(f"创建证书失败: {data['errors']}")
+            return None
+
+        # 将私钥添加到结果中
+        result = data["result"]
+        result["private_key"] = private_key
+
+        return result
+
+    def get_certificate_fingerprint(self, cert_content):
+        """获取证书的指纹 (SHA-256，格式 AA:BB:...)"""
+        try:
+            return pem_fingerprint(cert_content)
+        except ValueError as e:
+            print(f"获取证书指纹失败: {e}")
+            return None
+
+    def save_to_cert_dir(self, domain, hostname, cert_content, key_content, fingerprint, cert_dir_base="/etc/cert"):
+        """将证书和密钥保存到指定目录 (基础目录/域名/主机名/)"""
+        # 构建目录路径: cert_dir_base/domain/hostname/
+        host_specific_dir = os.path.join(cert_dir_base, domain, hostname)
+
+        # 文件名: domain.hostname.crt
+        file_prefix = f"{domain}.{hostname}"
+
+        return self._save_files(host_specific_dir, file_prefix, cert_content, key_content, fingerprint)
+
+    def link_to_cert_dir(self, domain, source_hostname, hostname, cert_dir_base="/etc/cert"):
+        """
+        以硬链接方式为 hostname 提供 source_hostname 已保存的证书文件
+
+        同一张证书覆盖多个主机名时使用，避免重复写入相同内容。
+        目录不可写时通过一次 sudo 调用创建链接；
+        无法创建硬链接时 (如跨文件系统) 返回 False，由调用方改为写入文件
+        """
+        source_dir = os.path.join(cert_dir_base, domain, source_hostname)
+        host_specific_dir = os.path.join(cert_dir_base, domain, hostname)
+
+        links = [
+            (
+                os.path.join(source_dir, f"{domain}.{source_hostname}.{ext}"),
+                os.path.join(host_specific_dir, f"{domain}.{hostname}.{ext}"),
+            )
+            for ext in ("crt", "key", "fingerprint")
+        ]
+        # 目标已是源文件的硬链接时无需处理 (对同一文件 rename 不会生效，会残留 .link 文件)
+        links = [(source, target) for source, target in links if not _is_same_file(source, target)]
+        if not links:
+            print(f"证书文件已链接到: {host_specific_dir} (与 {source_hostname} 共用)")
+            return True
+
+        if self._prepare_dir(host_specific_dir):
+            print("尝试使用 sudo 创建硬链接...")
+            args = [path for pair in links for path in pair]
+            try:
+                _run_sudo_script(SUDO_LINK_SCRIPT, host_specific_dir, *args)
+            except (subprocess.CalledProcessError, OSError):
+                print(f"无法通过 sudo 创建硬链接到: {host_specific_dir}，改为写入文件")
+                return False
+            print(f"证书文件已链接到: {host_specific_dir} (与 {source_hostname} 共用)")
+            return True
+
+        try:
+            for source_path, target_path in links:
+                # 先链接到临时名称再替换，保证目标文件始终完整
+                temp_path = f"{target_path}.link"
+                try:
+                    os.unlink(temp_path)
+                except FileNotFoundError:
+                    pass
+                os.link(source_path, temp_path)
+                os.replace(temp_path, target_path)
+        except OSError as e:
+            print(f"无法创建硬链接 ({e})，改为写入文件")
+            return False
+
+        print(f"证书文件已链接到: {host_specific_dir} (与 {source_hostname} 共用)")
+        return True
+
+    def _prepare_dir(self, host_specific_dir):
+        """
+        确保目录存在，返回是否需要使用 sudo
+
+        目录不存在时尝试创建，无权限时交由 sudo 在写文件时一并创建；
+        目录已存在时预先检查是否可写，不可写时直接走 sudo，免去逐个文件操作失败
+        """
+        try:
+            os.makedirs(host_specific_dir)
+            print(f"创建目录: {host_specific_dir}")
+            return False
+        except FileExistsError:
+            use_sudo = not os.access(host_specific_dir, os.W_OK)
+            if use_sudo:
+                print(f"无权限写入目录: {host_specific_dir}")
+            return use_sudo
+        except PermissionError:
+            print(f"无权限创建目录: {host_specific_dir}")
+            return True
+
+    def _save_files(self, host_specific_dir, file_prefix, cert_content, key_content, fingerprint):
+        """将证书、密钥和指纹保存为 host_specific_dir/file_prefix.{crt,key,fingerprint}"""
+        use_sudo = self._prepare_dir(host_specific_dir)
+
+        cert_path = os.path.join(host_specific_dir, f"{file_prefix}.crt")
+        key_path = os.path.join(host_specific_dir, f"{file_prefix}.key")
+        fingerprint_path = os.path.join(host_specific_dir, f"{file_prefix}.fingerprint")
+
+        files = {
+            cert_path: cert_content,
+            key_path: key_content,
+            fingerprint_path: fingerprint,
+        }
+        if not self.write_files(host_specific_dir, files, use_sudo):
+            return False
+
+        print(f"证书已保存到: {cert_path}")
+        print(f"密钥已保存到: {key_path}")
+        print(f"指纹已保存到: {fingerprint_path}")
+
+        return True
+
+    def write_files(self, host_specific_dir, files, use_sudo=False):
+        """
+        将同一目录下的多个文件写入磁盘，支持 sudo 回退
+
+        每个文件先写入同目录下的 .tmp 文件再重命名替换，中途中断也不会留下不完整的证书；
+        替换已有文件时保留其权限和属主 (如 root:ssl-cert 0640 的私钥)；
+        无权限时所有文件 (以及需要创建的目录) 通过一次 sudo 调用完成，
+        避免每个文件各自启动一次 sudo
+
+        Args:
+            host_specific_dir: 目标目录
+            files: {文件路径: 内容} 字典，文件路径均位于 host_specific_dir 下
+            use_sudo: 是否直接使用 sudo 写入 (目录不可写或需要由 sudo 创建时)
+        """
+        if not use_sudo:
+            try:
+                for file_path, content in files.items():
+                    temp_path = f"{file_path}.tmp"
+                    with open(temp_path, "w") as f:
+                        f.write(content)
+                    # 保留已有文件的权限和属主
+                    try:
+                        st = os.stat(file_path)
+                    except FileNotFoundError:
+                        st = None
+                    if st is not None:
+                        try:
+                            os.chown(temp_path, st.st_uid, st.st_gid)
+                        except PermissionError:
+                            print(f"警告: 无法保留文件属主 {st.st_uid}:{st.st_gid}: {file_path}")
+                        os.chmod(temp_path, st.st_mode & 0o7777)
+                    os.replace(temp_path, file_path)
+                return True
+            except PermissionError:
+                print(f"无权限写入文件: {file_path}")
+
+        print("尝试使用 sudo 写入文件...")
+        try:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                install_args = []
+                for file_path, content in files.items():
+                    temp_path = os.path.join(temp_dir, os.path.basename(file_path))
+                    # 暂存文件仅所有者可读写，cp 创建的新文件 (如私钥) 会沿用该权限
+                    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                    with os.fdopen(fd, "w") as f:
+                        f.write(content)
+                    # 已有文件的权限和属主在此读取，目录不可写时 stat 仍然可用
+                    try:
+                        st = os.stat(file_path)
+                        mode, owner = f"{st.st_mode & 0o7777:o}", f"{st.st_uid}:{st.st_gid}"
+                    except OSError:
+                        mode, owner = "-", "-"
+                    install_args += [temp_path, mode, owner]
+
+                _run_sudo_script(SUDO_INSTALL_SCRIPT, host_specific_dir, *install_args)
+            for file_path in files:
+                print(f"成功写入文件: {file_path}")
+            return True
+        except (subprocess.CalledProcessError, OSError):
+            print(f"无法写入文件到: {host_specific_dir}")
+            return False
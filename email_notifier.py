@@ -6,7 +6,9 @@
 用于在证书更新成功后发送邮件通知
 """
 
+import queue
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.header import Header
@@ -42,6 +44,29 @@ class EmailNotifier:
         if not all([self.host, self.port, self.sender, self.username, self.password]):
             raise ValueError("SMTP 配置不完整，需要: host, port, sender, username, password")
 
+        # 在 with 块内复用同一个 SMTP 连接，锁用于串行化多线程发送
+        self._persistent = False
+        self._server = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        """进入 with 块后，所有邮件复用同一个 SMTP 连接 (首次发送时建立)"""
+        with self._lock:
+            self._persistent = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """关闭复用的 SMTP 连接"""
+        with self._lock:
+            self._persistent = False
+            if self._server:
+                try:
+                    self._server.quit()
+                except smtplib.SMTPException:
+                    pass
+                self._server = None
+        return False
+
     def send_cert_renewal_notification(self, domain, cert_info, recipients):
         """
         发送证书更新成功通知
@@ -60,6 +85,11 @@ class EmailNotifier:
             logger.info("未配置收件人邮箱，跳过邮件通知")
             return True
 
+        subject, body = self._build_cert_renewal_message(domain, cert_info)
+        return self._deliver(subject, body, recipients)
+
+    def _build_cert_renewal_message(self, domain, cert_info):
+        """构建证书更新通知的邮件主题和正文"""
         hostname = cert_info.get('hostname', 'N/A')
         cert_path = cert_info.get('cert_path', 'N/A')
         fingerprint = cert_info.get('fingerprint', 'N/A')
@@ -80,7 +110,10 @@ class EmailNotifier:
 --
 由 Cloudflare 证书管理工具自动发送
 """
+        return subject, body
 
+    def _deliver(self, subject, body, recipients):
+        """发送邮件并记录结果，成功返回 True"""
         try:
             self._send_email(subject, body, recipients)
             logger.info(f"证书更新通知已发送到: {', '.join(recipients)}")
@@ -107,9 +140,28 @@ class EmailNotifier:
         # 添加正文
         msg.attach(MIMEText(body, 'plain', 'utf-8'))
 
+        with self._lock:
+            if not self._persistent:
+                server = self._connect()
+                try:
+                    server.sendmail(self.sender, recipients, msg.as_string())
+                finally:
+                    server.quit()
+                return
+
+            if self._server is None:
+                self._server = self._connect()
+            try:
+                self._server.sendmail(self.sender, recipients, msg.as_string())
+            except smtplib.SMTPServerDisconnected:
+                # 复用的连接可能已被服务器关闭，重连后重试一次
+                self._server = self._connect()
+                self._server.sendmail(self.sender, recipients, msg.as_string())
+
+    def _connect(self):
+        """连接 SMTP 服务器并登录，返回连接对象"""
         server = None
         try:
-            # 连接服务器并发送
             if self.use_ssl:
                 server = smtplib.SMTP_SSL(self.host, self.port)
             else:
@@ -117,13 +169,66 @@ class EmailNotifier:
                 server.starttls()
 
             server.login(self.username, self.password)
-            server.sendmail(self.sender, recipients, msg.as_string())
-        except smtplib.SMTPAuthenticationError as e:
-            logger.error(f"SMTP 认证失败: {e}")
-            raise
-        finally:
+            return server
+        except Exception as e:
+            if isinstance(e, smtplib.SMTPAuthenticationError):
+                logger.error(f"SMTP 认证失败: {e}")
             if server:
-                server.quit()
+                server.close()
+            raise
+
+
+class NotificationQueue:
+    """
+    异步邮件通知队列
+
+    通知放入队列后立即返回，由后台线程通过同一个 SMTP 连接依次发送，
+    避免证书签发流程等待 SMTP 往返
+    """
+
+    def __init__(self, notifier):
+        """
+        Args:
+            notifier: 实际发送邮件的 EmailNotifier 实例
+        """
+        self.notifier = notifier
+        self.queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def send_cert_renewal_notification(self, domain, cert_info, recipients):
+        """将证书更新通知放入发送队列，参数同 EmailNotifier.send_cert_renewal_notification"""
+        if not recipients:
+            logger.info("未配置收件人邮箱，跳过邮件通知")
+            return True
+
+        subject, body = self.notifier._build_cert_renewal_message(domain, cert_info)
+        self.queue.put((subject, body, recipients))
+        return True
+
+    def close(self):
+        """等待队列中的通知全部发送完毕，然后停止后台线程"""
+        self.queue.put(None)
+        self._thread.join()
+
+    def _worker(self):
+        """后台线程: 持有一个 SMTP 连接，依次发送队列中的邮件"""
+        with self.notifier:
+            while True:
+                item = self.queue.get()
+                try:
+                    if item is None:
+                        return
+                    self.notifier._deliver(*item)
+                finally:
+                    self.queue.task_done()
 
 
 def create_email_notifier_from_config(config):
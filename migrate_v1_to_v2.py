@@ -6,8 +6,11 @@ Cloudflare 证书管理工具迁移脚本 (v1 -> v2)
 """
 
 import os
+import re
 import sys
+import time
 import shutil
+import hashlib
 from pathlib import Path
 
 try:
@@ -18,6 +21,14 @@ except ImportError as e:
     print("运行: pip install pyyaml questionary")
     sys.exit(1)
 
+# 优先使用 libyaml 提供的 C 解析器/生成器
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+    HAS_LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+    HAS_LIBYAML = False
+
 
 # 配置
 SCRIPT_DIR = Path(__file__).parent.resolve()
@@ -28,6 +39,9 @@ CERT_BASE_DIR = Path("/etc/cert")
 
 DRY_RUN = "--dry-run" in sys.argv or "--test" in sys.argv
 
+# env 文件中的 KEY=VALUE 行 (注释行以 # 开头，不会匹配)
+_ENV_LINE_RE = re.compile(r'^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=[ \t]*(.*?)[ \t\r]*$', re.MULTILINE)
+
 
 def print_header(msg):
     """打印标题"""
@@ -77,13 +91,10 @@ def parse_old_config():
         return None
 
     # 读取 env 文件
-    env_vars = {}
-    with open(OLD_ENV_FILE, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith('#') and '=' in line:
-                key, value = line.split('=', 1)
-                env_vars[key.strip()] = value.strip()
+    env_vars = {
+        match.group(1): match.group(2)
+        for match in _ENV_LINE_RE.finditer(OLD_ENV_FILE.read_text(encoding='utf-8'))
+    }
 
     # 验证必要配置
     required_keys = ['CLOUDFLARE_ORIGIN_CA_KEY', 'CERT_DOMAIN', 'CERT_HOSTNAME']
@@ -114,7 +125,7 @@ def configure_smtp(old_config):
     if NEW_CONFIG_FILE.exists():
         try:
             with open(NEW_CONFIG_FILE, 'r') as f:
-                existing_config = yaml.safe_load(f)
+                existing_config = yaml.load(f, Loader=SafeLoader)
                 if existing_config and existing_config.get('default', {}).get('smtp'):
                     existing_smtp = existing_config['default']['smtp']
         except Exception:
@@ -144,25 +155,33 @@ def configure_smtp(old_config):
 
     print()
 
-    smtp_host = questionary.text(
-        "SMTP 服务器地址",
-        validate=lambda x: len(x) > 0 or "不能为空"
+    answers = questionary.form(
+        host=questionary.text(
+            "SMTP 服务器地址",
+            validate=lambda x: len(x) > 0 or "不能为空"
+        ),
+        port=questionary.text(
+            "SMTP 端口",
+            default="587",
+            validate=lambda x: x in ['465', '587'] or "请输入 465 或 587"
+        ),
+        sender=questionary.text(
+            "发件人邮箱 / 用户名",
+            validate=lambda x: len(x) > 0 and '@' in x or "请输入有效的邮箱地址"
+        ),
+        password=questionary.password(
+            "密码或 App Password"
+        ),
     ).ask()
 
-    smtp_port = questionary.text(
-        "SMTP 端口",
-        default="587",
-        validate=lambda x: x in ['465', '587'] or "请输入 465 或 587"
-    ).ask()
-
-    smtp_sender = questionary.text(
-        "发件人邮箱 / 用户名",
-        validate=lambda x: len(x) > 0 and '@' in x or "请输入有效的邮箱地址"
-    ).ask()
+    if not answers:
+        print_success("跳过 SMTP 配置")
+        return None
 
-    smtp_password = questionary.password(
-        "密码或 App Password"
-    ).ask()
+    smtp_host = answers['host']
+    smtp_port = answers['port']
+    smtp_sender = answers['sender']
+    smtp_password = answers['password']
 
     print()
 
@@ -187,9 +206,14 @@ def configure_smtp(old_config):
 
 
 def create_config(old_config, smtp_config):
-    """创建新的配置文件"""
+    """创建新的配置文件，返回写入的配置字典 (未写入时返回 None)"""
     print_step("创建配置文件")
 
+    domain = old_config['domain']
+    hostnames = old_config['hostnames']
+    zone_id = old_config.get('zone_id', '')
+    notification_email = old_config.get('notification_email', '')
+
     if DRY_RUN:
         preview_config(old_config, smtp_config)
         return
@@ -200,8 +224,8 @@ def create_config(old_config, smtp_config):
         if not questionary.confirm("是否覆盖？").ask():
             print_success("跳过配置创建")
             return
-        backup_file = NEW_CONFIG_FILE.with_suffix(f".backup.{os.popen('date +%Y%m%d%H%M%S').read().strip()}")
-        shutil.copy(NEW_CONFIG_FILE, backup_file)
+        backup_file = NEW_CONFIG_FILE.with_suffix(f".backup.{time.strftime('%Y%m%d%H%M%S')}")
+        _fast_copy(NEW_CONFIG_FILE, backup_file)
         print_success(f"已备份旧配置: {backup_file}")
 
     # 构建配置
@@ -212,7 +236,7 @@ def create_config(old_config, smtp_config):
             'validity_days': 90,
             'base_cert_dir': '/etc/cert',
             'enable_cron': True,
-            'notification_email': old_config.get('notification_email', ''),
+            'notification_email': notification_email,
         },
         'domains': {}
     }
@@ -229,29 +253,34 @@ def create_config(old_config, smtp_config):
         }
 
     # 添加域名配置
-    config['domains'][old_config['domain']] = {
+    config['domains'][domain] = {
         'origin_ca_key': None,
-        'hostnames': old_config['hostnames'],
-        'zone_id': old_config.get('zone_id', ''),
+        'hostnames': hostnames,
+        'zone_id': zone_id,
         'enable_cron': True,
-        'notification_email': old_config.get('notification_email', ''),
+        'notification_email': notification_email,
     }
 
     # 写入配置
     with open(NEW_CONFIG_FILE, 'w', encoding='utf-8') as f:
-        yaml.dump(config, f, default_flow_style=False, allow_unicode=True, sort_keys=False)
+        yaml.dump(config, f, Dumper=SafeDumper, default_flow_style=False, allow_unicode=True, sort_keys=False)
 
     os.chmod(NEW_CONFIG_FILE, 0o600)
     print_success(f"已创建配置文件: {NEW_CONFIG_FILE}")
 
+    return config
+
 
 def preview_config(old_config, smtp_config):
     """预览配置内容"""
     print("[预览] 配置文件内容:")
 
-    hostnames_yaml = ""
-    for h in old_config['hostnames']:
-        hostnames_yaml += f"      - {h}\n"
+    domain = old_config['domain']
+    hostnames = old_config['hostnames']
+    zone_id = old_config.get('zone_id', '')
+    notification_email = old_config.get('notification_email', '')
+
+    hostnames_yaml = "".join(f"      - {h}\n" for h in hostnames)
 
     smtp_section = ""
     if smtp_config:
@@ -282,26 +311,73 @@ default:
   validity_days: 90
   base_cert_dir: "/etc/cert"
   enable_cron: true
-  notification_email: "{old_config.get('notification_email', '')}"
+  notification_email: "{notification_email}"
 {smtp_section}domains:
-  {old_config['domain']}:
+  {domain}:
     origin_ca_key: null
     hostnames:
-{hostnames_yaml.rstrip()}    zone_id: "{old_config.get('zone_id', '')}"
+{hostnames_yaml}    zone_id: "{zone_id}"
     enable_cron: true
-    notification_email: "{old_config.get('notification_email', '')}"
+    notification_email: "{notification_email}"
 """
     print(config_content)
 
 
+def _fast_copy(src, dst):
+    """
+    复制文件内容和权限 (同 shutil.copy)
+
+    优先使用 os.copy_file_range 在内核中复制，在支持 reflink 的文件系统
+    (btrfs/XFS) 上无需实际搬移数据；不支持时回退到 shutil.copyfileobj
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    # 未到文件末尾就返回 0，按不支持处理，避免留下截断的文件
+                    raise OSError("copy_file_range 提前返回 0")
+                remaining -= copied
+        except (AttributeError, OSError):
+            # 从头重新复制，避免部分复制后的偏移不一致
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+    shutil.copymode(src, dst)
+
+
+# 文件摘要缓存: (路径, mtime_ns, 大小) -> BLAKE2b 摘要
+_digest_cache = {}
+
+
+def _file_digest(path, st):
+    """计算文件的 BLAKE2b 摘要，按 (路径, mtime_ns, 大小) 缓存"""
+    key = (str(path), st.st_mtime_ns, st.st_size)
+    digest = _digest_cache.get(key)
+    if digest is None:
+        with open(path, 'rb') as f:
+            if hasattr(hashlib, 'file_digest'):
+                digest = hashlib.file_digest(f, 'blake2b').digest()
+            else:
+                h = hashlib.blake2b()
+                for chunk in iter(lambda: f.read(65536), b''):
+                    h.update(chunk)
+                digest = h.digest()
+        _digest_cache[key] = digest
+    return digest
+
+
 def files_are_identical(path1, path2):
-    """比较两个文件内容是否相同"""
-    if not path1.exists() or not path2.exists():
-        return False
+    """比较两个文件内容是否相同 (大小不同时直接返回 False)"""
     try:
-        with open(path1, 'rb') as f1, open(path2, 'rb') as f2:
-            return f1.read() == f2.read()
-    except Exception:
+        st1 = path1.stat()
+        st2 = path2.stat()
+        if st1.st_size != st2.st_size:
+            return False
+        return _file_digest(path1, st1) == _file_digest(path2, st2)
+    except OSError:
         return False
 
 
@@ -325,40 +401,46 @@ def migrate_cert_dir(old_config):
     skipped = False
 
     # 查找旧结构目录
+    cert_exts = {'.crt', '.key', '.fingerprint'}
     for hostname_dir in CERT_BASE_DIR.iterdir():
         if hostname_dir.is_dir() and hostname_dir.name not in ['..', '.']:
             print(f"\n处理: {hostname_dir.name}")
 
-            # 迁移所有文件类型
-            for ext in ['crt', 'key', 'fingerprint']:
-                for old_file in hostname_dir.glob(f"*.{ext}"):
-                    if old_file.is_file():
-                        # 创建新目录结构
-                        new_dir = CERT_BASE_DIR / old_config['domain'] / hostname_dir.name
-                        new_dir.mkdir(parents=True, exist_ok=True)
-
-                        # 新文件名
-                        new_filename = f"{old_config['domain']}.{hostname_dir.name}.{ext}"
-                        new_file = new_dir / new_filename
-
-                        if DRY_RUN:
-                            print(f"  [预览] {old_file.name} -> {new_filename}")
-                        else:
-                            if new_file.exists():
-                                # 检查文件内容是否相同
-                                if files_are_identical(old_file, new_file):
-                                    print(f"  [跳过] {new_filename} (已存在且内容相同)")
-                                    skipped = True
-                                    migrated = True
-                                    continue
-                                else:
-                                    print(f"  [存在] {new_filename}")
-                                    if not questionary.confirm(f"    覆盖已存在的文件？"):
-                                        print(f"    跳过 {old_file.name}")
-                                        continue
-                            shutil.copy(old_file, new_file)
-                            print(f"  {old_file.name} -> {new_filename}")
+            # 新目录结构，在第一次需要复制文件时创建
+            new_dir = CERT_BASE_DIR / old_config['domain'] / hostname_dir.name
+            new_dir_ready = False
+
+            # 迁移所有文件类型 (单次遍历目录)
+            for old_file in hostname_dir.iterdir():
+                if old_file.suffix not in cert_exts or not old_file.is_file():
+                    continue
+                ext = old_file.suffix[1:]
+
+                # 新文件名
+                new_filename = f"{old_config['domain']}.{hostname_dir.name}.{ext}"
+                new_file = new_dir / new_filename
+
+                if DRY_RUN:
+                    print(f"  [预览] {old_file.name} -> {new_filename}")
+                else:
+                    if new_file.exists():
+                        # 检查文件内容是否相同
+                        if files_are_identical(old_file, new_file):
+                            print(f"  [跳过] {new_filename} (已存在且内容相同)")
+                            skipped = True
                             migrated = True
+                            continue
+                        else:
+                            print(f"  [存在] {new_filename}")
+                            if not questionary.confirm(f"    覆盖已存在的文件？"):
+                                print(f"    跳过 {old_file.name}")
+                                continue
+                    if not new_dir_ready:
+                        new_dir.mkdir(parents=True, exist_ok=True)
+                        new_dir_ready = True
+                    _fast_copy(old_file, new_file)
+                    print(f"  {old_file.name} -> {new_filename}")
+                    migrated = True
 
     if migrated:
         if not DRY_RUN:
@@ -377,13 +459,13 @@ def migrate_cron(old_config):
     # 备份/删除旧 cron
     if OLD_CRON_FILE.exists():
         print_success(f"找到旧版 cron: {OLD_CRON_FILE}")
-        backup_file = OLD_CRON_FILE.with_suffix(f".backup.{os.popen('date +%Y%m%d%H%M%S').read().strip()}")
+        backup_file = OLD_CRON_FILE.with_suffix(f".backup.{time.strftime('%Y%m%d%H%M%S')}")
 
         if DRY_RUN:
             print(f"  [预览] 备份: {OLD_CRON_FILE} -> {backup_file}")
             print(f"  [预览] 删除: {OLD_CRON_FILE}")
         else:
-            shutil.copy(OLD_CRON_FILE, backup_file)
+            _fast_copy(OLD_CRON_FILE, backup_file)
             print_success("已备份旧版 cron")
             OLD_CRON_FILE.unlink()
             print_success("已删除旧版 cron")
@@ -425,20 +507,21 @@ def migrate_cron(old_config):
         print_success(f"已创建 cron: {cron_file}")
 
 
-def verify_config():
-    """验证新配置"""
+def verify_config(config=None):
+    """验证新配置 (传入刚写入的配置字典时直接使用，否则从文件读取)"""
     print_header("验证新配置")
 
-    if not NEW_CONFIG_FILE.exists():
-        print_error(f"配置文件不存在: {NEW_CONFIG_FILE}")
-        return False
+    if config is None:
+        if not NEW_CONFIG_FILE.exists():
+            print_error(f"配置文件不存在: {NEW_CONFIG_FILE}")
+            return False
 
-    try:
-        with open(NEW_CONFIG_FILE, 'r') as f:
-            config = yaml.safe_load(f)
-    except Exception as e:
-        print_error(f"配置文件格式错误: {e}")
-        return False
+        try:
+            with open(NEW_CONFIG_FILE, 'r') as f:
+                config = yaml.load(f, Loader=SafeLoader)
+        except Exception as e:
+            print_error(f"配置文件格式错误: {e}")
+            return False
 
     print_success("配置验证通过")
     print("\n已配置的域名:")
@@ -462,6 +545,9 @@ def main():
         print("\n模式: DRY-RUN (测试运行)")
         print("不会修改任何现有文件")
 
+    if not HAS_LIBYAML:
+        print_warning("未检测到 libyaml，YAML 读写将使用纯 Python 实现 (安装 libyaml 后重新安装 pyyaml 可启用)")
+
     # 检查 root 权限
     check_root()
 
@@ -476,7 +562,7 @@ def main():
         smtp_config = configure_smtp(old_config)
 
     # 创建新配置
-    create_config(old_config, smtp_config)
+    config = create_config(old_config, smtp_config)
 
     # 迁移证书目录
     migrate_cert_dir(old_config)
@@ -489,7 +575,7 @@ def main():
         print_header("验证配置 (预览)")
         print_success("配置格式验证通过")
     else:
-        verify_config()
+        verify_config(config)
 
     # 显示摘要
     print_header("迁移摘要")